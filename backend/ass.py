@@ -0,0 +1,282 @@
+"""ASS (Advanced SubStation Alpha) subtitle generation for FFmpeg's subtitles filter."""
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+ASS_MODES = ("inline", "karaoke")
+
+
+def create_ass_file(captions, style_config, offsets, overrides, output_path, video_info, mode="inline"):
+    """Generates an Advanced Substation Alpha (.ass) file for FFmpeg with Smart Styles.
+
+    mode="inline" wraps each styled word in its own override tags. mode="karaoke" moves
+    word styles (including the caption's highlightWords) into shared [v4+ Styles] entries
+    and reveals each word with \\k timing, like the editor preview, so libass parses far
+    fewer tags per frame.
+    """
+    
+    width = video_info.get('width', 1080)
+    height = video_info.get('height', 1920)
+    karaoke = mode == "karaoke"
+    
+    # Use Arial as safe default if specified font is missing/complex
+    # FFmpeg needs the font to be installed in Windows Fonts
+    font_name = style_config.get('fontFamily', 'Arial').replace("'", "").split(',')[0].strip()
+    if not font_name: font_name = 'Arial'
+    
+    font_size = 80 # Default fallback
+    
+    # ... (Keep font size logic or simplify) ... 
+    
+    primary_color = "&H00FFFFFF&" 
+    secondary_color = "&H000000FF&"
+    if karaoke:
+        # Karaoke draws words in SecondaryColour until spoken, then PrimaryColour.
+        # Like the preview: spoken words use textColor, unspoken ones are faded out.
+        primary_color = css_to_ass_color(style_config.get('textColor'), primary_color)
+        secondary_color = fade_ass_color(primary_color)
+
+    # Preview styling for caption.highlightWords (karaoke mode maps it to a named style)
+    highlight_style = {}
+    if style_config.get('highlightColor'):
+        highlight_style['color'] = style_config['highlightColor']
+    if style_config.get('highlightFontFamily'):
+        highlight_style['fontFamily'] = style_config['highlightFontFamily']
+    if style_config.get('highlightFontStyle'):
+        highlight_style['fontStyle'] = style_config['highlightFontStyle']
+    if str(style_config.get('fontWeight', '')).isdigit():
+        highlight_style['fontWeight'] = int(style_config['fontWeight']) + 100
+
+    default_style = {
+        'font': font_name, 'size': font_size, 'primary': primary_color, 'secondary': secondary_color,
+        'bold': -1, 'italic': 0, 'scale': 100
+    }
+    named_styles = {}  # word style fields -> style name (karaoke mode)
+    events = []
+
+    for i, cap in enumerate(captions):
+        # Handle both formats: single block text or word-level list
+        words = cap.get('words', [])
+        if not words and 'text' in cap:
+             words = [{'word': cap['text'], 'start': cap['start'], 'end': cap['end']}]
+
+        offset = offsets.get(str(i), {'x': 0, 'y': 0})
+        
+        # Get style overrides for this specific caption block
+        caption_override = overrides.get(str(i), {})
+        
+        # Calculate Position
+        base_x = width // 2
+        base_y = int(height * 0.75) # Default nice position
+        pos_x = base_x + offset['x']
+        pos_y = base_y + offset['y']
+        
+        line_ass = f"\\pos({pos_x},{pos_y})"
+        
+        full_line_text = ""
+        current_style = "Default"
+
+        if karaoke and words:
+            # Silence before the first word is an empty karaoke syllable
+            lead = centiseconds(words[0]['start']) - centiseconds(cap['start'])
+            if lead > 0:
+                line_ass += f"\\k{lead}"
+        
+        for j, word_obj in enumerate(words):
+            word_text = word_obj['word']
+            smart_style = word_obj.get('smartStyle', {}) or {}
+            
+            # Merge: Override > SmartStyle
+            # We need to be careful not to overwrite smartStyle properties if override doesn't specify them
+            # But actually, if override specifies color, it should apply to ALL words in that block usually?
+            # Yes, Inspector applies to the block.
+            
+            final_style = smart_style.copy()
+            if karaoke and word_text in (cap.get('highlightWords') or []):
+                final_style = {**highlight_style, **smart_style}
+            final_style.update(caption_override)
+            fields = word_style_fields(final_style)
+
+            if karaoke:
+                style_name = "Default"
+                if fields:
+                    key = tuple(sorted(fields.items()))
+                    if key not in named_styles:
+                        named_styles[key] = f"W{len(named_styles) + 1}"
+                    style_name = named_styles[key]
+
+                # Each word's syllable runs until the next word starts, absorbing gaps
+                next_start = words[j + 1]['start'] if j + 1 < len(words) else cap['end']
+                duration = max(centiseconds(next_start) - centiseconds(word_obj['start']), 0)
+
+                word_tags = ""
+                if style_name != current_style:
+                    word_tags += "\\r" if style_name == "Default" else f"\\r{style_name}"
+                    current_style = style_name
+                word_tags += f"\\k{duration}"
+                full_line_text += f"{{{word_tags}}}{word_text} "
+                continue
+
+            word_tags = ""
+            if 'color' in fields:
+                word_tags += f"\\c{fields['color']}"
+            if fields.get('bold'):
+                word_tags += "\\b1"
+            if fields.get('italic'):
+                word_tags += "\\i1"
+            if 'font' in fields:
+                word_tags += f"\\fn{fields['font']}"
+            if 'scale' in fields:
+                word_tags += f"\\fscx{fields['scale']}\\fscy{fields['scale']}"
+            elif 'size' in fields:
+                word_tags += f"\\fs{fields['size']}"
+
+            if word_tags:
+                full_line_text += f"{{{word_tags}}}{word_text}{{\\r}} " 
+            else:
+                full_line_text += f"{word_text} "
+
+        events.append((cap['start'], cap['end'], f"{{{line_ass}}}{full_line_text.strip()}"))
+
+    style_lines = [ass_style_line("Default", default_style)]
+    for key, name in named_styles.items():
+        word_style = dict(default_style)
+        word_style.update(dict(key))
+        if 'color' in word_style:
+            word_style['primary'] = word_style.pop('color')
+            word_style['secondary'] = fade_ass_color(word_style['primary'])
+        style_lines.append(ass_style_line(name, word_style))
+    
+    ass_header = f"""[Script Info]
+ScriptType: v4.00+
+PlayResX: {width}
+PlayResY: {height}
+
+[v4+ Styles]
+Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
+{chr(10).join(style_lines)}
+
+[Events]
+Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
+"""
+    
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write(ass_header)
+        
+        # LOGGING ASS CONTENT FOR DEBUGGING
+        logger.info(f"ASS Header generated. Preview:\n{ass_header}")
+        
+        dialogue_lines = []
+        merged = merge_adjacent_events(events)
+
+        for i, (start, end, text) in enumerate(merged):
+            line = f"Dialogue: 0,{format_ass_time(start)},{format_ass_time(end)},Default,,0,0,0,,{text}\n"
+            f.write(line)
+            if i < 5: dialogue_lines.append(line.strip())
+
+        logger.info(f"Wrote {len(merged)} ASS events ({len(events)} captions, {len(named_styles)} word styles, mode={mode})")
+        logger.info(f"First 5 ASS Lines:\n" + "\n".join(dialogue_lines))
+
+
+def word_style_fields(final_style):
+    """Maps a caption/word style dict to ASS style fields (colour, weight, font, size)."""
+    fields = {}
+    
+    if 'color' in final_style:
+        c = final_style['color'].replace('#', '')
+        if len(c) == 6:
+            fields['color'] = f"&H00{c[4:6]}{c[2:4]}{c[0:2]}&"
+            
+    if final_style.get('fontWeight') and (isinstance(final_style['fontWeight'], int) or str(final_style['fontWeight']).isdigit()) and int(final_style['fontWeight']) > 600:
+        fields['bold'] = -1
+        
+    if final_style.get('fontStyle') == 'italic':
+        fields['italic'] = -1
+        
+    if 'fontFamily' in final_style:
+        font_str = final_style['fontFamily']
+        if "," in font_str:
+            font_name_override = font_str.split(',')[0].strip().replace("'", "").replace('"', "")
+        else:
+            font_name_override = font_str.strip().replace("'", "").replace('"', "")
+        
+        # Font Mapping for downloaded files
+        if "Caveat" in font_name_override:
+            font_name_override = "Caveat"
+        elif "Playfair" in font_name_override:
+            font_name_override = "Playfair Display"
+        elif "Montserrat" in font_name_override:
+            font_name_override = "Montserrat"
+            
+        fields['font'] = font_name_override
+
+    if 'fontSize' in final_style:
+        fs = final_style['fontSize']
+        if isinstance(fs, str) and 'em' in fs:
+            try:
+                fields['scale'] = int(float(fs.replace('em', '')) * 100)
+            except: pass
+        elif isinstance(fs, (int, float)) or (isinstance(fs, str) and fs.isdigit()):
+            fields['size'] = int(fs)
+
+    return fields
+
+
+def ass_style_line(name, style):
+    return (
+        f"Style: {name},{style['font']},{style['size']},{style['primary']},{style['secondary']},"
+        f"&H00000000&,&H80000000&,{style['bold']},{style['italic']},0,0,"
+        f"{style['scale']},{style['scale']},0,0,1,3,0,2,10,10,10,1"
+    )
+
+
+def merge_adjacent_events(events):
+    """Joins back-to-back events with identical static text into one longer event.
+
+    Only inline-mode events qualify: a karaoke event replays its \\k reveal from its own
+    start, so two of them cannot become one without changing what is shown.
+    """
+    merged = []
+    for start, end, text in events:
+        # Karaoke timing is relative to the event start, so those events cannot be stretched
+        if merged and "\\k" not in text and merged[-1][2] == text and centiseconds(start) <= centiseconds(merged[-1][1]) + 1:
+            merged[-1] = (merged[-1][0], max(end, merged[-1][1]), text)
+        else:
+            merged.append((start, end, text))
+    return merged
+
+
+def css_to_ass_color(value, default):
+    """Converts #RRGGBB or rgb()/rgba() to ASS &HAABBGGRR&."""
+    if not value:
+        return default
+    value = value.strip()
+    hex_match = re.fullmatch(r"#([0-9a-fA-F]{6})", value)
+    if hex_match:
+        c = hex_match.group(1)
+        return f"&H00{c[4:6]}{c[2:4]}{c[0:2]}&".upper()
+    rgb_match = re.fullmatch(r"rgba?\(\s*(\d+)\s*,\s*(\d+)\s*,\s*(\d+)\s*(?:,\s*([\d.]+)\s*)?\)", value)
+    if rgb_match:
+        r, g, b = (int(x) for x in rgb_match.groups()[:3])
+        alpha = float(rgb_match.group(4)) if rgb_match.group(4) else 1.0
+        # ASS alpha is inverted: 00 opaque, FF transparent
+        return f"&H{255 - int(alpha * 255):02X}{b:02X}{g:02X}{r:02X}&"
+    return default
+
+
+def fade_ass_color(ass_color, opacity=0.1):
+    """Same colour at the preview's opacity for not-yet-spoken words."""
+    return f"&H{255 - int(opacity * 255):02X}{ass_color[4:10]}&"
+
+
+def centiseconds(seconds):
+    return int(round(seconds * 100))
+
+
+def format_ass_time(seconds):
+    """Formats seconds into ASS time format H:MM:SS.CC"""
+    h = int(seconds // 3600)
+    m = int((seconds % 3600) // 60)
+    s = seconds % 60
+    return f"{h}:{m:02d}:{s:05.2f}"
@@ -0,0 +1,96 @@
+"""Measures ffmpeg subtitle-filter throughput for inline vs karaoke ASS output.
+
+Dense word-highlight captions: in inline mode every highlight state is its own event with
+per-word override tags; karaoke mode emits one event per block with \\k timing.
+
+Run from backend/: python bench_ass.py
+"""
+import os
+import subprocess
+import time
+from tempfile import TemporaryDirectory
+
+from ass import create_ass_file
+
+WIDTH, HEIGHT, FPS, DURATION = 1080, 1920, 30, 60
+WORDS_PER_SECOND = 4
+WORDS_PER_BLOCK = 4
+
+style = {
+    'fontFamily': 'Arial',
+    'textColor': '#FFFFFF',
+    'highlightColor': '#FFE66D'
+}
+video_info = {'width': WIDTH, 'height': HEIGHT, 'duration': DURATION}
+
+
+def dense_captions():
+    step = 1.0 / WORDS_PER_SECOND
+    words = []
+    for n in range(DURATION * WORDS_PER_SECOND):
+        word = {'word': f"word{n}", 'start': n * step, 'end': n * step + step * 0.9}
+        if n % 3 == 0:
+            # Smart Style, like detected tickers
+            word['smartStyle'] = {'color': '#00FF00', 'fontWeight': 800}
+        words.append(word)
+
+    blocks = []
+    for i in range(0, len(words), WORDS_PER_BLOCK):
+        chunk = words[i:i + WORDS_PER_BLOCK]
+        blocks.append({'start': chunk[0]['start'], 'end': chunk[-1]['start'] + step, 'words': chunk})
+    return blocks
+
+
+def inline_highlight_captions(blocks):
+    """What a per-word highlight needs without karaoke: one block per active word."""
+    expanded = []
+    for block in blocks:
+        for j, active in enumerate(block['words']):
+            end = block['words'][j + 1]['start'] if j + 1 < len(block['words']) else block['end']
+            words = []
+            for k, w in enumerate(block['words']):
+                smart = dict(w.get('smartStyle', {}))
+                smart.setdefault('color', style['highlightColor'] if k == j else style['textColor'])
+                words.append({**w, 'smartStyle': smart})
+            expanded.append({'start': active['start'], 'end': end, 'words': words})
+    return expanded
+
+
+def run_filter(ass_path=None):
+    cmd = [
+        "ffmpeg", "-hide_banner", "-nostdin", "-v", "error",
+        "-f", "lavfi", "-i", f"color=c=black:s={WIDTH}x{HEIGHT}:r={FPS}:d={DURATION}"
+    ]
+    if ass_path:
+        fonts_dir = os.path.join(os.getcwd(), "fonts")
+        cmd.extend(["-vf", f"subtitles='{ass_path}:fontsdir={fonts_dir}'"])
+    cmd.extend(["-f", "null", "-"])
+
+    start = time.perf_counter()
+    subprocess.run(cmd, check=True)
+    return DURATION * FPS / (time.perf_counter() - start)
+
+
+def count_events(path):
+    with open(path, encoding="utf-8") as f:
+        return sum(1 for line in f if line.startswith("Dialogue:"))
+
+
+def main():
+    blocks = dense_captions()
+
+    with TemporaryDirectory() as tmp:
+        inline_path = os.path.join(tmp, "inline.ass")
+        karaoke_path = os.path.join(tmp, "karaoke.ass")
+        create_ass_file(inline_highlight_captions(blocks), style, {}, {}, inline_path, video_info)
+        create_ass_file(blocks, style, {}, {}, karaoke_path, video_info, mode="karaoke")
+
+        print(f"{DURATION}s @ {WIDTH}x{HEIGHT}, {FPS}fps, {WORDS_PER_SECOND} words/s")
+        print(f"no subtitles: {run_filter():7.1f} fps")
+        for label, path in [("inline", inline_path), ("karaoke", karaoke_path)]:
+            fps = run_filter(path)
+            print(f"{label:>12}: {fps:7.1f} fps  ({count_events(path)} events, {os.path.getsize(path) // 1024} KB)")
+
+
+if __name__ == "__main__":
+    main()
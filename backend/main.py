@@ -1,6 +1,6 @@
 from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Form
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
@@ -14,6 +14,14 @@ from openai import OpenAI
 import json
 import subprocess
 import re
+import math
+import asyncio
+import time
+import threading
+import hashlib
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+from ass import ASS_MODES, create_ass_file
 
 
 import logging
@@ -42,6 +50,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Peak-Rate", "X-Start"],
 )
 
 
@@ -52,10 +61,27 @@ if os.path.exists(ffmpeg_path):
 else:
     logger.warning("Warning: Could not find ffmpeg path automatically. Ensure it is installed and in PATH.")
 
+WHISPER_MODEL_NAME = "base"
+HINGLISH_PROMPT = "The audio is in Hinglish, a mix of Hindi and English. Transcribe in Roman script."
+
 logger.info("Loading Whisper model...")
-model = whisper.load_model("base")
+model = whisper.load_model(WHISPER_MODEL_NAME)
 logger.info("Whisper model loaded!")
 
+# Sizes /retranscribe may use; anything beyond the default must be enabled explicitly
+RETRANSCRIBE_MODELS = [
+    name.strip() for name in os.environ.get("RETRANSCRIBE_MODELS", WHISPER_MODEL_NAME).split(",") if name.strip()
+]
+
+# The default model plus at most one other allowed size, loaded on first use
+loaded_models = {WHISPER_MODEL_NAME: model}
+
+# Whisper installs per-call hooks on the model, so transcriptions must not overlap.
+model_lock = threading.Lock()
+# Admitted jobs queue for the model here, on the event loop, so waiting does not hold
+# one of the threadpool's workers (which load_audio, renders and yt-dlp also need).
+model_queue = asyncio.Lock()
+
 
 # Initialize OpenAI client (uses OPENAI_API_KEY env var)
 openai_client = None
@@ -66,49 +92,341 @@ else:
     print("Warning: OPENAI_API_KEY not set. Content generation will use fallback mode.")
 
 
+# --- Admission Control ---
+# Heavy endpoints are admitted by estimated cost (seconds of worker time) against a
+# global backlog budget instead of a flat per-IP request count.
+
+# Seconds of inference per second of audio, relative to real time on CPU
+WHISPER_COST_PER_AUDIO_SECOND = {
+    "tiny": 0.05,
+    "base": 0.1,
+    "small": 0.3,
+    "medium": 0.8,
+    "large": 1.6,
+}
+
+# Seconds of libx264 + libass work per rendered pixel-frame (~1080x1920 @ 60fps realtime)
+RENDER_COST_PER_PIXEL_FRAME = 8e-9
+
+ADMISSION_BUDGET_SECONDS = float(os.environ.get("ADMISSION_BUDGET_SECONDS", "600"))
+
+# Bounds on the learned actual/estimated correction, so outliers cannot zero out a job's cost
+CALIBRATION_MIN = 0.25
+CALIBRATION_MAX = 4.0
+
+
+class AdmissionTicket:
+    def __init__(self, kind, cost):
+        self.kind = kind
+        self.cost = cost
+        self.started_at = None
+
+    def start(self):
+        self.started_at = time.monotonic()
+
+    def remaining(self):
+        if self.started_at is None:
+            return self.cost
+        return max(self.cost - (time.monotonic() - self.started_at), 0.0)
+
+
+class AdmissionController:
+    """Admits jobs while the estimated backlog stays within a global time budget."""
+
+    def __init__(self, budget_seconds):
+        self.budget = budget_seconds
+        self.lock = threading.Lock()
+        self.tickets = []
+        # Observed actual/estimated ratio per job kind, refined as jobs complete
+        self.calibration = {}
+
+    def backlog(self):
+        return sum(t.remaining() for t in self.tickets)
+
+    def admit(self, kind, estimated_cost):
+        """Reserve budget for a job or raise 429 with a Retry-After from the drain time."""
+        cost = estimated_cost * self.calibration.get(kind, 1.0)
+        with self.lock:
+            backlog = self.backlog()
+            # An idle server always takes the job, however large
+            if self.tickets and backlog + cost > self.budget:
+                retry_after = math.ceil(backlog - max(self.budget - cost, 0.0))
+                logger.warning(f"Rejected {kind} job (cost {cost:.1f}s, backlog {backlog:.1f}s). Retry in {retry_after}s")
+                raise HTTPException(
+                    status_code=429,
+                    detail=f"Server busy: estimated {backlog:.0f}s of queued work",
+                    headers={"Retry-After": str(max(retry_after, 1))}
+                )
+            ticket = AdmissionTicket(kind, cost)
+            self.tickets.append(ticket)
+
+        logger.info(f"Admitted {kind} job (cost {cost:.1f}s, backlog {backlog + cost:.1f}s)")
+        return ticket
+
+    def release(self, ticket, succeeded):
+        """Frees the job's budget; only successful runs refine the cost calibration."""
+        with self.lock:
+            if ticket in self.tickets:
+                self.tickets.remove(ticket)
+            # Failed jobs end early, so their timing says nothing about real cost
+            if succeeded and ticket.started_at is not None and ticket.cost > 0:
+                ratio = (time.monotonic() - ticket.started_at) / ticket.cost
+                previous = self.calibration.get(ticket.kind, 1.0)
+                updated = 0.8 * previous + 0.2 * (previous * ratio)
+                self.calibration[ticket.kind] = min(max(updated, CALIBRATION_MIN), CALIBRATION_MAX)
+
+
+admission = AdmissionController(ADMISSION_BUDGET_SECONDS)
+
+
+def estimate_transcribe_cost(duration, model_name=WHISPER_MODEL_NAME):
+    # Whisper always decodes at least one full 30s window, however short the clip
+    return max(duration, whisper.audio.CHUNK_LENGTH) * WHISPER_COST_PER_AUDIO_SECOND.get(model_name, 1.0)
+
+
+def estimate_render_cost(video_info, fps):
+    frames = video_info.get('duration', 0) * fps
+    return video_info.get('width', 1080) * video_info.get('height', 1920) * frames * RENDER_COST_PER_PIXEL_FRAME
+
+
+def get_model(model_name):
+    if model_name not in loaded_models:
+        # Unload the previous extra size first so only one is ever held besides the default
+        for name in [n for n in loaded_models if n != WHISPER_MODEL_NAME]:
+            logger.info(f"Unloading Whisper model '{name}'")
+            del loaded_models[name]
+        logger.info(f"Loading Whisper model '{model_name}'...")
+        loaded_models[model_name] = whisper.load_model(model_name)
+    return loaded_models[model_name]
+
+
+def run_transcription(ticket, audio, model_name=WHISPER_MODEL_NAME, **kwargs):
+    """Runs Whisper on a worker thread once the model is free."""
+    with model_lock:
+        whisper_model = get_model(model_name)
+        ticket.start()
+        return whisper_model.transcribe(audio, **kwargs)
+
+
+async def transcribe_admitted(ticket, audio, **kwargs):
+    """Waits for the model on the event loop, then transcribes on a worker thread."""
+    async with model_queue:
+        return await run_in_threadpool(run_transcription, ticket, audio, **kwargs)
+
+
+# --- Media Cache ---
+# Uploads are kept under their SHA-256 so transcripts can be edited incrementally later.
+MEDIA_DIR = os.environ.get("MEDIA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "media_cache"))
+os.makedirs(MEDIA_DIR, exist_ok=True)
+
+# Least recently used media is evicted once the cache grows past this many bytes
+MEDIA_CACHE_MAX_BYTES = int(os.environ.get("MEDIA_CACHE_MAX_BYTES", str(20 * 1024 ** 3)))
+
+RETRANSCRIBE_PAD_SECONDS = 1.0
+RETRANSCRIBE_MAX_PAD_SECONDS = 5.0
+RETRANSCRIBE_MAX_WINDOW_SECONDS = 120.0
+RETRANSCRIBE_CONTEXT_WORDS = 30
+
+# media_id -> number of requests currently using it; eviction leaves these alone
+active_media = {}
+active_media_lock = threading.Lock()
+
+
+def acquire_media(media_id):
+    with active_media_lock:
+        active_media[media_id] = active_media.get(media_id, 0) + 1
+
+
+def release_media(media_id):
+    with active_media_lock:
+        active_media[media_id] -= 1
+        if not active_media[media_id]:
+            del active_media[media_id]
+
+
+def store_media(file):
+    """Copies an upload into the media cache, returning (media_id, path, is_new).
+
+    The media is marked active; callers must release_media() it when done.
+    """
+    ext = os.path.splitext(file.filename or "")[1].lower() or ".mp4"
+    digest = hashlib.sha256()
+    temp_file = NamedTemporaryFile(delete=False, suffix=ext, dir=MEDIA_DIR)
+    with temp_file as buffer:
+        for chunk in iter(lambda: file.file.read(1024 * 1024), b""):
+            digest.update(chunk)
+            buffer.write(chunk)
+
+    media_id = digest.hexdigest()
+    acquire_media(media_id)
+    media_path = find_media(media_id)
+    is_new = media_path is None
+    if is_new:
+        media_path = os.path.join(MEDIA_DIR, media_id + ext)
+        os.replace(temp_file.name, media_path)
+    else:
+        os.remove(temp_file.name)
+
+    evict_media()
+    return media_id, media_path, is_new
+
+
+def find_media(media_id):
+    if not isinstance(media_id, str) or not re.fullmatch(r"[0-9a-f]{64}", media_id):
+        return None
+    for name in os.listdir(MEDIA_DIR):
+        stem, ext = os.path.splitext(name)
+        if stem == media_id and ext != ".json":
+            path = os.path.join(MEDIA_DIR, name)
+            # mtime doubles as the LRU timestamp for eviction
+            os.utime(path)
+            return path
+    return None
+
+
+def delete_media(media_id):
+    """Removes a media file with its transcript and waveform peaks."""
+    for name in os.listdir(MEDIA_DIR):
+        if name.startswith(media_id + "."):
+            os.remove(os.path.join(MEDIA_DIR, name))
+
+
+def evict_media():
+    """Deletes least recently used media until the cache fits MEDIA_CACHE_MAX_BYTES."""
+    entries = {}  # media_id -> [bytes, last used]
+    for name in os.listdir(MEDIA_DIR):
+        media_id = name.split(".", 1)[0]
+        if not re.fullmatch(r"[0-9a-f]{64}", media_id):
+            continue  # uploads still being written
+        stat = os.stat(os.path.join(MEDIA_DIR, name))
+        entry = entries.setdefault(media_id, [0, 0.0])
+        entry[0] += stat.st_size
+        entry[1] = max(entry[1], stat.st_mtime)
+
+    total = sum(size for size, _ in entries.values())
+    for media_id, (size, _) in sorted(entries.items(), key=lambda item: item[1][1]):
+        if total <= MEDIA_CACHE_MAX_BYTES:
+            break
+        with active_media_lock:
+            if media_id in active_media:
+                continue  # a running request still needs it
+            delete_media(media_id)
+        total -= size
+        logger.info(f"Evicted media {media_id} ({size} bytes) from cache")
+
+
+def save_transcript(media_id, captions):
+    with open(os.path.join(MEDIA_DIR, media_id + ".json"), "w", encoding="utf-8") as f:
+        json.dump(captions, f)
+
+
+def load_transcript(media_id):
+    path = os.path.join(MEDIA_DIR, media_id + ".json")
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+# --- Waveform Peaks ---
+# Level 0 holds one (min, max) pair per PEAK_BASE_SAMPLES samples (250 peaks/sec at 16 kHz);
+# each further level halves the resolution, down to ~2 peaks/sec.
+PEAK_BASE_SAMPLES = 64
+PEAK_LEVELS = 8
+# Peaks per /waveform tile; fixed so each (level, tile) URL is stable and cacheable
+WAVEFORM_TILE_PEAKS = 4096
+
+
+def peaks_path(media_id):
+    return os.path.join(MEDIA_DIR, media_id + ".peaks.npz")
+
+
+def build_peak_pyramid(audio):
+    """Returns int8 arrays of shape (n, 2) with (min, max) per bin, finest level first."""
+    full = len(audio) // PEAK_BASE_SAMPLES
+    frames = audio[:full * PEAK_BASE_SAMPLES].reshape(full, PEAK_BASE_SAMPLES)
+    mins = frames.min(axis=1)
+    maxs = frames.max(axis=1)
+    tail = audio[full * PEAK_BASE_SAMPLES:]
+    if len(tail) or not full:
+        mins = np.append(mins, tail.min() if len(tail) else 0.0)
+        maxs = np.append(maxs, tail.max() if len(tail) else 0.0)
+
+    levels = []
+    for _ in range(PEAK_LEVELS):
+        levels.append(np.stack([mins, maxs], axis=1))
+        if len(mins) == 1:
+            break
+        if len(mins) % 2:
+            mins = np.append(mins, mins[-1])
+            maxs = np.append(maxs, maxs[-1])
+        mins = mins.reshape(-1, 2).min(axis=1)
+        maxs = maxs.reshape(-1, 2).max(axis=1)
+
+    return [np.clip(np.round(level * 127), -127, 127).astype(np.int8) for level in levels]
+
+
+def ensure_peak_pyramid(media_id, audio):
+    """Builds and caches the pyramid for a stored media file unless it already exists."""
+    path = peaks_path(media_id)
+    if os.path.exists(path):
+        return path
+    # Write aside and rename, so readers never see a half-written file
+    temp_file = NamedTemporaryFile(delete=False, suffix=".npz", dir=MEDIA_DIR)
+    with temp_file as f:
+        np.savez(f, *build_peak_pyramid(audio))
+    os.replace(temp_file.name, path)
+    return path
+
+
 @app.post("/transcribe")
-@limiter.limit("10/minute")
 async def transcribe_video(request: Request, file: UploadFile = File(...)):
     if not file:
         raise HTTPException(status_code=400, detail="No file uploaded")
     
     print(f"Received file: {file.filename}")
 
-    # Save uploaded file temporarily
-    temp_file = NamedTemporaryFile(delete=False, suffix=".mp4") # Or detect extension
+    media_id, is_new = None, False
     try:
-        with temp_file as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        print(f"Saved temp file to: {temp_file.name}")
-        
-        # Force English to get Hinglish (romanized Hindi) instead of Urdu/Devanagari script
-        # The prompt helps steer it towards Romanized transcription
-        result = model.transcribe(
-            temp_file.name, 
-            word_timestamps=True, 
-            language='en',
-            initial_prompt="The audio is in Hinglish, a mix of Hindi and English. Transcribe in Roman script."
-        )
-        
+        # Keep the upload under its content hash so later edits can reuse it
+        media_id, media_path, is_new = await run_in_threadpool(store_media, file)
+        print(f"Stored media {media_id} at: {media_path}")
+
+        duration = get_media_duration(media_path)
+        if not duration:
+            raise HTTPException(status_code=400, detail="Could not read media duration")
+
+        ticket = admission.admit("transcribe", estimate_transcribe_cost(duration))
+        succeeded = False
+        try:
+            # Decode once: the same samples feed the waveform pyramid and Whisper
+            audio = await run_in_threadpool(load_audio, media_path)
+            await run_in_threadpool(ensure_peak_pyramid, media_id, audio)
+
+            # Force English to get Hinglish (romanized Hindi) instead of Urdu/Devanagari script
+            # The prompt helps steer it towards Romanized transcription
+            result = await transcribe_admitted(
+                ticket,
+                audio,
+                word_timestamps=True,
+                language='en',
+                initial_prompt=HINGLISH_PROMPT
+            )
+            succeeded = True
+        finally:
+            admission.release(ticket, succeeded)
+
         # Format for our React app: [{word, start, end, confidence}, ...]
-        formatted_captions = []
-        
-        for segment in result["segments"]:
-            for word in segment["words"]:
-                formatted_captions.append({
-                    "word": word["word"].strip(),
-                    "start": word["start"],
-                    "end": word["end"],
-                    "confidence": word.get("probability", 1.0)
-                })
+        formatted_captions = format_words(result)
         
         print(f"Transcription complete. Found {len(formatted_captions)} words.")
+        save_transcript(media_id, formatted_captions)
         
         # Get video info
-        video_info = get_video_info(temp_file.name)
+        video_info = get_video_info(media_path)
         
         return {
+            "mediaId": media_id,
             "captions": formatted_captions,
             "width": video_info["width"],
             "height": video_info["height"],
@@ -116,18 +434,162 @@ async def transcribe_video(request: Request, file: UploadFile = File(...)):
         }
 
     except Exception as e:
+        # Rejected or failed uploads are not worth keeping in the cache
+        if is_new:
+            delete_media(media_id)
+            print(f"Removed media {media_id} after failed transcription")
+        if isinstance(e, HTTPException):
+            raise
         print(f"Error during transcription: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
-        
+
     finally:
-        # Cleanup
-        if os.path.exists(temp_file.name):
-            os.remove(temp_file.name)
-            print("Temp file cleaned up")
+        if media_id:
+            release_media(media_id)
+
+
+@app.post("/retranscribe")
+async def retranscribe_window(request: Request, data: dict):
+    """Re-transcribe only [start, end] of a stored media file and splice the result in."""
+    media_id = data.get("mediaId", "")
+    if not isinstance(media_id, str):
+        raise HTTPException(status_code=400, detail="mediaId must be a string")
+    media_path = find_media(media_id)
+    if not media_path:
+        raise HTTPException(status_code=404, detail="Unknown media id")
+
+    try:
+        start = float(data["start"])
+        end = float(data["end"])
+    except (KeyError, TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="start and end (seconds) are required")
+    try:
+        pad = float(data.get("pad", RETRANSCRIBE_PAD_SECONDS))
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="pad must be a number of seconds")
+    if not all(math.isfinite(v) for v in (start, end, pad)):
+        raise HTTPException(status_code=400, detail="start, end and pad must be finite numbers")
+    pad = min(max(pad, 0.0), RETRANSCRIBE_MAX_PAD_SECONDS)
+
+    duration = get_media_duration(media_path)
+    if not duration:
+        raise HTTPException(status_code=400, detail="Could not read media duration")
+    start = max(start, 0.0)
+    end = min(end, duration)
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start and within the media")
+    if end - start > RETRANSCRIBE_MAX_WINDOW_SECONDS:
+        raise HTTPException(status_code=400, detail=f"Window is limited to {RETRANSCRIBE_MAX_WINDOW_SECONDS:.0f}s; use /transcribe for longer spans")
+
+    model_name = data.get("model") or WHISPER_MODEL_NAME
+    if not isinstance(model_name, str) or model_name not in RETRANSCRIBE_MODELS:
+        raise HTTPException(status_code=400, detail=f"model must be one of {', '.join(RETRANSCRIBE_MODELS)}")
+
+    # Splice into the editor's current words if sent, otherwise the stored transcript
+    captions = data.get("captions") or load_transcript(media_id)
+    if not valid_word_list(captions):
+        raise HTTPException(status_code=400, detail="captions must be a list of {word, start, end}")
+
+    # Whisper continues more naturally when prompted with the words just before the window
+    prompt = data.get("prompt") or HINGLISH_PROMPT
+    if not isinstance(prompt, str):
+        raise HTTPException(status_code=400, detail="prompt must be a string")
+    preceding = [w["word"] for w in captions if w["end"] <= start][-RETRANSCRIBE_CONTEXT_WORDS:]
+    if preceding:
+        prompt = f"{prompt} {' '.join(preceding)}"
+
+    window_start = max(start - pad, 0.0)
+    window_end = min(end + pad, duration)
+
+    acquire_media(media_id)
+    try:
+        # It may have been evicted before we marked it active
+        if not os.path.exists(media_path):
+            raise HTTPException(status_code=404, detail="Unknown media id")
+
+        # Own kind: padded short windows would skew the calibration of full-length jobs
+        ticket = admission.admit("retranscribe", estimate_transcribe_cost(window_end - window_start, model_name))
+        succeeded = False
+        try:
+            audio = await run_in_threadpool(load_audio, media_path, window_start, window_end - window_start)
+            result = await transcribe_admitted(
+                ticket,
+                audio,
+                model_name=model_name,
+                word_timestamps=True,
+                language='en',
+                initial_prompt=prompt
+            )
+            succeeded = True
+        finally:
+            admission.release(ticket, succeeded)
+
+        new_words = format_words(result, offset=window_start)
+        spliced = splice_words(captions, new_words, start, end)
+        save_transcript(media_id, spliced)
+
+        print(f"Re-transcribed {start:.2f}-{end:.2f}s of {media_id} with {model_name}: {len(new_words)} words in window")
+
+        return {
+            "mediaId": media_id,
+            "captions": spliced
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error during re-transcription: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        release_media(media_id)
+
+
+@app.get("/waveform/{media_id}")
+async def get_waveform(media_id: str, start: float = 0.0, end: float = None, zoom: float = 50.0, level: int = None, tile: int = None):
+    """Serves (min, max) int8 peak pairs for [start, end], or for one fixed-size tile, from a pyramid level.
+
+    The level is given directly or picked as the coarsest one with >= zoom peaks/sec.
+    """
+    # Pyramids are built during /transcribe; decoding here would bypass admission control
+    path = peaks_path(media_id)
+    if not find_media(media_id) or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="No waveform for this media id")
+
+    try:
+        base_rate = whisper.audio.SAMPLE_RATE / PEAK_BASE_SAMPLES
+        with np.load(path) as pyramid:
+            if level is None:
+                level = 0
+                while level + 1 < len(pyramid.files) and base_rate / 2 ** (level + 1) >= zoom:
+                    level += 1
+            level = min(max(level, 0), len(pyramid.files) - 1)
+            peaks = pyramid[f"arr_{level}"]
+
+        rate = base_rate / 2 ** level
+        if tile is not None:
+            first = min(max(tile, 0) * WAVEFORM_TILE_PEAKS, len(peaks))
+            last = min(first + WAVEFORM_TILE_PEAKS, len(peaks))
+        else:
+            first = min(max(int(start * rate), 0), len(peaks))
+            last = len(peaks) if end is None else min(max(math.ceil(end * rate), first), len(peaks))
+
+        return Response(
+            content=peaks[first:last].tobytes(),
+            media_type="application/octet-stream",
+            headers={
+                "X-Peak-Rate": str(rate),
+                "X-Start": str(first / rate),
+                # Keyed by content hash, so a tile never changes
+                "Cache-Control": "public, max-age=31536000, immutable"
+            }
+        )
+
+    except Exception as e:
+        print(f"Error serving waveform: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/transcribe-url")
-@limiter.limit("10/minute")
 async def transcribe_from_url(request: Request, data: dict):
     """Download video from URL (YouTube/Instagram) and transcribe it."""
     url = data.get("url", "").strip()
@@ -157,25 +619,36 @@ async def transcribe_from_url(request: Request, data: dict):
             'no_warnings': True,
         }
         
-        # Download audio
-        print("Downloading audio from URL...")
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=True)
+            # Probe metadata first so oversized jobs are rejected before downloading
+            info = await run_in_threadpool(ydl.extract_info, url, download=False)
             video_title = info.get('title', 'Untitled')
-            video_duration = info.get('duration', 0)
-        
-        # The actual file might have .mp3 extension appended
-        actual_path = temp_audio_path
-        if not os.path.exists(actual_path) and os.path.exists(temp_audio_path.replace('.mp3', '') + '.mp3'):
-            actual_path = temp_audio_path.replace('.mp3', '') + '.mp3'
-        
-        print(f"Downloaded: {video_title} ({video_duration}s)")
-        print(f"Audio saved to: {actual_path}")
-        
-        # Transcribe with Whisper
-        print("Transcribing audio...")
-        result = model.transcribe(actual_path, word_timestamps=True, language='en')
-        
+            video_duration = info.get('duration', 0) or 0
+
+            # Unknown length (e.g. live streams) is costed as a full budget, never as free
+            cost = estimate_transcribe_cost(video_duration) if video_duration else ADMISSION_BUDGET_SECONDS
+            ticket = admission.admit("transcribe", cost)
+            succeeded = False
+            try:
+                # Download audio
+                print("Downloading audio from URL...")
+                await run_in_threadpool(ydl.process_ie_result, info, download=True)
+
+                # The actual file might have .mp3 extension appended
+                actual_path = temp_audio_path
+                if not os.path.exists(actual_path) and os.path.exists(temp_audio_path.replace('.mp3', '') + '.mp3'):
+                    actual_path = temp_audio_path.replace('.mp3', '') + '.mp3'
+
+                print(f"Downloaded: {video_title} ({video_duration}s)")
+                print(f"Audio saved to: {actual_path}")
+
+                # Transcribe with Whisper
+                print("Transcribing audio...")
+                result = await transcribe_admitted(ticket, actual_path, word_timestamps=True, language='en')
+                succeeded = True
+            finally:
+                admission.release(ticket, succeeded)
+
         # Format captions
         formatted_captions = []
         full_text = ""
@@ -202,6 +675,8 @@ async def transcribe_from_url(request: Request, data: dict):
     except yt_dlp.utils.DownloadError as e:
         print(f"Download error: {str(e)}")
         raise HTTPException(status_code=400, detail=f"Could not download video: {str(e)}")
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error processing URL: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -354,6 +829,87 @@ def get_video_info(path):
         return {"width": 1080, "height": 1920, "duration": 0} # Fallback
 
 
+def get_media_duration(path):
+    """Container duration in seconds via ffprobe (works for audio-only files too); None if unreadable."""
+    try:
+        cmd = [
+            "ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "json", path
+        ]
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        info = json.loads(result.stdout)
+        return float(info['format']['duration'])
+    except Exception as e:
+        print(f"Error getting media duration: {e}")
+        return None
+
+
+def load_audio(path, start=0.0, duration=None):
+    """Decodes [start, start + duration] (default: all) to 16 kHz mono float32, as Whisper expects."""
+    cmd = ["ffmpeg", "-nostdin", "-v", "error"]
+    if start > 0:
+        cmd.extend(["-ss", f"{start:.3f}"])
+    if duration is not None:
+        cmd.extend(["-t", f"{duration:.3f}"])
+    cmd.extend([
+        "-i", path,
+        "-f", "s16le", "-ac", "1", "-ar", str(whisper.audio.SAMPLE_RATE), "-"
+    ])
+    result = subprocess.run(cmd, capture_output=True, check=True)
+    return np.frombuffer(result.stdout, np.int16).astype(np.float32) / 32768.0
+
+
+def format_words(result, offset=0.0):
+    """Flattens Whisper segments into [{word, start, end, confidence}, ...]."""
+    words = []
+    for segment in result["segments"]:
+        for word in segment["words"]:
+            words.append({
+                "word": word["word"].strip(),
+                "start": word["start"] + offset,
+                "end": word["end"] + offset,
+                "confidence": word.get("probability", 1.0)
+            })
+    return words
+
+
+def valid_word_list(captions):
+    """True for a list of {word: str, start: number, end: number} dicts."""
+    if not isinstance(captions, list):
+        return False
+    for w in captions:
+        if not isinstance(w, dict) or not isinstance(w.get("word"), str):
+            return False
+        for key in ("start", "end"):
+            if isinstance(w.get(key), bool) or not isinstance(w.get(key), (int, float)):
+                return False
+            if not math.isfinite(w[key]):
+                return False
+    return True
+
+
+def splice_words(captions, new_words, start, end):
+    """Replaces words centred in [start, end] with new_words, leaving the rest untouched."""
+    def in_window(w):
+        return start <= (w["start"] + w["end"]) / 2 <= end
+
+    before = [w for w in captions if not in_window(w) and w["start"] < start]
+    after = [w for w in captions if not in_window(w) and w["start"] >= start]
+
+    # New words may not overlap the neighbours that stay where they are
+    lo = max([start] + [w["end"] for w in before])
+    hi = min([end] + [w["start"] for w in after])
+
+    middle = []
+    for w in new_words:
+        if not in_window(w):
+            continue
+        w_start = min(max(w["start"], lo), hi)
+        w_end = min(max(w["end"], w_start), hi)
+        middle.append({**w, "start": round(w_start, 3), "end": round(w_end, 3)})
+
+    return before + middle + after
+
+
 def generate_fallback_content(script: str) -> dict:
     """Generate basic content without AI API."""
     words = script.split()
@@ -384,8 +940,12 @@ async def render_video(
     overrides_json: str = Form(None),
     overlays_json: str = Form(None),
     fps: str = Form("30"),
+    ass_mode: str = Form("karaoke"),
 ):
     """Render video with burned-in captions and overlays using FFmpeg."""
+    if ass_mode not in ASS_MODES:
+        raise HTTPException(status_code=400, detail=f"ass_mode must be one of {', '.join(ASS_MODES)}")
+
     try:
         logger.info("Starting video render...")
         captions = json.loads(captions_json)
@@ -404,7 +964,7 @@ async def render_video(
 
         # Create ASS file
         video_info = get_video_info(input_temp.name)
-        create_ass_file(captions, style_config, offsets, overrides, ass_path, video_info)
+        create_ass_file(captions, style_config, offsets, overrides, ass_path, video_info, mode=ass_mode)
 
         # Build FFmpeg command with complex filters for overlays
         # 1. Start with input video
@@ -501,9 +1061,22 @@ async def render_video(
                 output_path
             ])
         
+        # Some containers carry no stream duration; fall back to the container's
+        if not video_info.get('duration'):
+            video_info['duration'] = get_media_duration(input_temp.name)
+        if not video_info['duration']:
+            raise HTTPException(status_code=400, detail="Could not read media duration")
+
+        ticket = admission.admit("render", estimate_render_cost(video_info, float(fps)))
         logger.info(f"Running FFmpeg: {' '.join(ffmpeg_cmd)}")
-        process = subprocess.run(ffmpeg_cmd, capture_output=True, text=True)
-        
+        ticket.start()
+        succeeded = False
+        try:
+            process = await run_in_threadpool(subprocess.run, ffmpeg_cmd, capture_output=True, text=True)
+            succeeded = process.returncode == 0
+        finally:
+            admission.release(ticket, succeeded)
+
         if process.returncode != 0:
             logger.error(f"FFmpeg Error: {process.stderr}")
             raise HTTPException(status_code=500, detail=f"FFmpeg failed: {process.stderr}")
@@ -545,153 +1118,12 @@ async def render_video(
         )
 
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Render unexpected error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-def create_ass_file(captions, style_config, offsets, overrides, output_path, video_info):
-    """Generates an Advanced Substation Alpha (.ass) file for FFmpeg with Smart Styles."""
-    
-    width = video_info.get('width', 1080)
-    height = video_info.get('height', 1920)
-    
-    # Use Arial as safe default if specified font is missing/complex
-    # FFmpeg needs the font to be installed in Windows Fonts
-    font_name = style_config.get('fontFamily', 'Arial').replace("'", "").split(',')[0].strip()
-    if not font_name: font_name = 'Arial'
-    
-    font_size = 80 # Default fallback
-    
-    # ... (Keep font size logic or simplify) ... 
-    
-    primary_color = "&H00FFFFFF&" 
-    
-    ass_header = f"""[Script Info]
-ScriptType: v4.00+
-PlayResX: {width}
-PlayResY: {height}
-
-[v4+ Styles]
-Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
-Style: Default,{font_name},{font_size},{primary_color},&H000000FF&,&H00000000&,&H80000000&,-1,0,0,0,100,100,0,0,1,3,0,2,10,10,10,1
-
-[Events]
-Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
-"""
-    
-    with open(output_path, "w", encoding="utf-8") as f:
-        f.write(ass_header)
-        
-        # LOGGING ASS CONTENT FOR DEBUGGING
-        logger.info(f"ASS Header generated. Preview:\n{ass_header}")
-        
-        dialogue_lines = []
-        
-        for i, cap in enumerate(captions):
-            # ... (rest of loop)
-            # We need to capture the lines to log them, but also write them.
-            # Let's write directly but also keep a buffer for the first few to log.
-            pass 
-
-        # REWRITE LOOP TO ENABLE LOGGING AND WRITING
-        for i, cap in enumerate(captions):
-            # Handle both formats: single block text or word-level list
-            words = cap.get('words', [])
-            if not words and 'text' in cap:
-                 words = [{'word': cap['text'], 'start': cap['start'], 'end': cap['end']}]
-
-            start_time = format_ass_time(cap['start'])
-            end_time = format_ass_time(cap['end'])
-            
-            offset = offsets.get(str(i), {'x': 0, 'y': 0})
-            
-            # Get style overrides for this specific caption block
-            caption_override = overrides.get(str(i), {})
-            
-            # Calculate Position
-            base_x = width // 2
-            base_y = int(height * 0.75) # Default nice position
-            pos_x = base_x + offset['x']
-            pos_y = base_y + offset['y']
-            
-            line_ass = f"\\pos({pos_x},{pos_y})"
-            
-            full_line_text = ""
-            
-            for word_obj in words:
-                word_text = word_obj['word']
-                smart_style = word_obj.get('smartStyle', {}) or {}
-                
-                # Merge: Override > SmartStyle
-                # We need to be careful not to overwrite smartStyle properties if override doesn't specify them
-                # But actually, if override specifies color, it should apply to ALL words in that block usually?
-                # Yes, Inspector applies to the block.
-                
-                final_style = smart_style.copy()
-                final_style.update(caption_override)
-                
-                word_tags = ""
-                
-                if final_style:
-                    if 'color' in final_style:
-                        c = final_style['color'].replace('#', '')
-                        if len(c) == 6:
-                            ass_c = f"&H00{c[4:6]}{c[2:4]}{c[0:2]}&"
-                            word_tags += f"\\c{ass_c}"
-                            
-                    if final_style.get('fontWeight') and (isinstance(final_style['fontWeight'], int) or str(final_style['fontWeight']).isdigit()) and int(final_style['fontWeight']) > 600:
-                        word_tags += "\\b1"
-                        
-                    if final_style.get('fontStyle') == 'italic':
-                        word_tags += "\\i1"
-                        
-                if 'fontFamily' in final_style:
-                    font_str = final_style['fontFamily']
-                    if "," in font_str:
-                        font_name_override = font_str.split(',')[0].strip().replace("'", "").replace('"', "")
-                    else:
-                        font_name_override = font_str.strip().replace("'", "").replace('"', "")
-                    
-                    # Font Mapping for downloaded files
-                    if "Caveat" in font_name_override:
-                        font_name_override = "Caveat"
-                    elif "Playfair" in font_name_override:
-                        font_name_override = "Playfair Display"
-                    elif "Montserrat" in font_name_override:
-                        font_name_override = "Montserrat"
-                        
-                    word_tags += f"\\fn{font_name_override}"
-
-                if 'fontSize' in final_style:
-                    fs = final_style['fontSize']
-                    if isinstance(fs, str) and 'em' in fs:
-                        try:
-                            scale = float(fs.replace('em', '')) * 100
-                            word_tags += f"\\fscx{int(scale)}\\fscy{int(scale)}"
-                        except: pass
-                    elif isinstance(fs, (int, float)) or (isinstance(fs, str) and fs.isdigit()):
-                        word_tags += f"\\fs{int(fs)}"
-
-            if word_tags:
-                full_line_text += f"{{{word_tags}}}{word_text}{{\\r}} " 
-            else:
-                full_line_text += f"{word_text} "
-
-            line = f"Dialogue: 0,{start_time},{end_time},Default,,0,0,0,,{{{line_ass}}}{full_line_text.strip()}\n"
-            f.write(line)
-            if i < 5: dialogue_lines.append(line.strip())
-
-        logger.info(f"First 5 ASS Lines:\n" + "\n".join(dialogue_lines))
-
-
-def format_ass_time(seconds):
-    """Formats seconds into ASS time format H:MM:SS.CC"""
-    h = int(seconds // 3600)
-    m = int((seconds % 3600) // 60)
-    s = seconds % 60
-    return f"{h}:{m:02d}:{s:05.2f}"
-
-
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -9,6 +9,9 @@ import { parseTranscript } from './utils/transcriptParser';
 import { detectTradingTerms, getSmartStyle } from './utils/tradingTerms';
 import { CAPTION_STYLES } from './constants/styles';
 
+// Export subtitles reveal words as they are spoken, matching the preview
+const ASS_MODE = 'karaoke';
+
 function App() {
   // --- State Management ---
   const [projectTitle, setProjectTitle] = useState('Untitled Project');
@@ -32,6 +35,7 @@ function App() {
   const [isPlaying, setIsPlaying] = useState(false);
   const [videoUrl, setVideoUrl] = useState(null);
   const [videoBlob, setVideoBlob] = useState(null);
+  const [mediaId, setMediaId] = useState(null);
 
   const [renderProgress, setRenderProgress] = useState(0);
   const [isRendering, setIsRendering] = useState(false);
@@ -140,6 +144,7 @@ function App() {
 
     setIsProcessing(true);
     setVideoBlob(file);
+    setMediaId(null);
     setVideoUrl(URL.createObjectURL(file));
     setProjectTitle(file.name.replace(/\.[^/.]+$/, ""));
 
@@ -158,6 +163,7 @@ function App() {
       const transcriptData = responseData.captions || [];
 
       setTranscript(transcriptData);
+      setMediaId(responseData.mediaId || null);
       setRawTranscript(JSON.stringify(transcriptData, null, 2));
 
       // Auto-Analyze Emphasis
@@ -386,6 +392,7 @@ function App() {
       formData.append('overrides_json', JSON.stringify(captionOverrides));
       formData.append('overlays_json', JSON.stringify(overlays));
       formData.append('fps', isHighFps ? '60' : '30');
+      formData.append('ass_mode', ASS_MODE);
       // Pass aspect ratio if backend supports it in future
       // formData.append('aspect_ratio', aspectRatio);
 
@@ -719,7 +726,7 @@ function App() {
               ref={timelineRef}
               captions={generatedCaptions.captions}
               previewTime={previewTime}
-              videoUrl={videoUrl}
+              mediaId={mediaId}
               onSeek={handleSeek}
               onUpdateCaption={handleUpdateCaption}
               onDeleteCaption={handleDeleteCaption}
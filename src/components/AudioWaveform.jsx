@@ -1,59 +1,110 @@
 import React, { useEffect, useRef, useState } from 'react';
 
-const AudioWaveform = ({ videoUrl, zoom, duration }) => {
+// Must match the backend pyramid: 16 kHz / 64 samples per peak, halving per level
+const PEAK_BASE_RATE = 250;
+const PEAK_LEVELS = 8;
+const TILE_PEAKS = 4096; // WAVEFORM_TILE_PEAKS on the backend
+
+// Coarsest level that still has at least one peak per pixel at this zoom (px/sec)
+const levelForZoom = (zoom) => {
+    let level = 0;
+    while (level + 1 < PEAK_LEVELS && PEAK_BASE_RATE / 2 ** (level + 1) >= zoom) level++;
+    return level;
+};
+
+const AudioWaveform = ({ mediaId, zoom, duration, scrollRef }) => {
     const canvasRef = useRef(null);
-    const [audioData, setAudioData] = useState(null);
+    const inFlight = useRef(new Set());
+    const [tiles, setTiles] = useState({}); // `${mediaId}:${level}:${tile}` -> { peaks, rate, start }
+    const [viewport, setViewport] = useState({ left: 0, width: 0 });
+
+    const level = levelForZoom(zoom);
+    const rate = PEAK_BASE_RATE / 2 ** level;
+    const tileSeconds = TILE_PEAKS / rate;
+
+    // Visible time range, from the Timeline's scroll container
+    const viewStart = viewport.left / zoom;
+    const viewEnd = Math.min((viewport.left + viewport.width) / zoom, duration);
+    const firstTile = Math.floor(viewStart / tileSeconds);
+    const lastTile = Math.max(firstTile, Math.ceil(viewEnd / tileSeconds) - 1);
 
     useEffect(() => {
-        if (!videoUrl) return;
-
-        const extractAudio = async () => {
-            try {
-                const audioContext = new (window.AudioContext || window.webkitAudioContext)();
-                const response = await fetch(videoUrl);
-                const arrayBuffer = await response.arrayBuffer();
-                const audioBuffer = await audioContext.decodeAudioData(arrayBuffer);
-
-                // Downsample for rendering
-                const channelData = audioBuffer.getChannelData(0);
-                const step = Math.ceil(channelData.length / 2000); // 2000 points
-                const points = [];
-                for (let i = 0; i < channelData.length; i += step) {
-                    points.push(channelData[i]);
-                }
-                setAudioData(points);
-            } catch (err) {
-                console.error("Waveform extraction failed:", err);
-            }
+        const container = scrollRef?.current;
+        if (!container) return;
+
+        const update = () => setViewport({ left: container.scrollLeft, width: container.clientWidth });
+        // ResizeObserver also reports the initial size
+        const observer = new ResizeObserver(update);
+        observer.observe(container);
+        container.addEventListener('scroll', update, { passive: true });
+        return () => {
+            observer.disconnect();
+            container.removeEventListener('scroll', update);
         };
+    }, [scrollRef]);
+
+    useEffect(() => {
+        if (!mediaId || !viewport.width) return;
 
-        extractAudio();
-    }, [videoUrl]);
+        for (let tile = firstTile; tile <= lastTile; tile++) {
+            const key = `${mediaId}:${level}:${tile}`;
+            if (tiles[key] || inFlight.current.has(key)) continue;
+            inFlight.current.add(key);
+
+            // Fixed tile URLs, so revisiting a range or level is served from the HTTP cache
+            fetch(`http://localhost:8000/waveform/${mediaId}?level=${level}&tile=${tile}`)
+                .then(async (response) => {
+                    if (!response.ok) throw new Error(`Waveform request failed (${response.status})`);
+                    const data = {
+                        peaks: new Int8Array(await response.arrayBuffer()), // [min0, max0, min1, max1, ...]
+                        rate: parseFloat(response.headers.get('X-Peak-Rate')),
+                        start: parseFloat(response.headers.get('X-Start')) || 0
+                    };
+                    // Drop tiles belonging to a previous video
+                    setTiles(prev => {
+                        const next = {};
+                        for (const k of Object.keys(prev)) {
+                            if (k.startsWith(`${mediaId}:`)) next[k] = prev[k];
+                        }
+                        next[key] = data;
+                        return next;
+                    });
+                })
+                .catch(err => console.error("Waveform fetch failed:", err))
+                .finally(() => inFlight.current.delete(key));
+        }
+    }, [mediaId, level, firstTile, lastTile, tiles, viewport.width]);
 
     useEffect(() => {
-        if (!audioData || !canvasRef.current) return;
+        if (!canvasRef.current) return;
 
         const canvas = canvasRef.current;
         const ctx = canvas.getContext('2d');
-        const width = duration * zoom;
+        const width = viewport.width;
         const height = canvas.height;
+        const mid = height / 2;
 
         canvas.width = width;
         ctx.clearRect(0, 0, width, height);
+        ctx.fillStyle = 'rgba(255, 255, 255, 0.2)';
 
-        ctx.beginPath();
-        ctx.moveTo(0, height / 2);
-        ctx.strokeStyle = 'rgba(255, 255, 255, 0.2)';
-        ctx.lineWidth = 1;
+        const step = zoom / rate; // px per peak
+        for (let tile = firstTile; tile <= lastTile; tile++) {
+            const data = tiles[`${mediaId}:${level}:${tile}`];
+            if (!data) continue;
 
-        const step = width / audioData.length;
-        for (let i = 0; i < audioData.length; i++) {
-            const x = i * step;
-            const y = (0.5 + audioData[i] * 0.5) * height;
-            ctx.lineTo(x, y);
+            // Only the peaks inside the viewport
+            const count = data.peaks.length / 2;
+            const from = Math.max(0, Math.floor((viewStart - data.start) * data.rate));
+            const to = Math.min(count, Math.ceil((viewEnd - data.start) * data.rate));
+            for (let i = from; i < to; i++) {
+                const x = (data.start + i / data.rate) * zoom - viewport.left;
+                const top = mid - (data.peaks[2 * i + 1] / 127) * mid;
+                const bottom = mid - (data.peaks[2 * i] / 127) * mid;
+                ctx.fillRect(x, top, Math.max(step, 1), Math.max(bottom - top, 1));
+            }
         }
-        ctx.stroke();
-    }, [audioData, zoom, duration]);
+    }, [tiles, mediaId, level, rate, zoom, viewport, viewStart, viewEnd, firstTile, lastTile]);
 
     return (
         <canvas
@@ -61,9 +112,9 @@ const AudioWaveform = ({ videoUrl, zoom, duration }) => {
             style={{
                 position: 'absolute',
                 top: 0,
-                left: 0,
+                left: viewport.left,
                 height: '100%',
-                width: duration * zoom,
+                width: viewport.width,
                 pointerEvents: 'none',
                 zIndex: 5
             }}
@@ -138,7 +138,7 @@ const CaptionBlocks = React.memo(({
 const Timeline = React.forwardRef(({
     captions,
     previewTime, // Still used for initial state and manual seeks
-    videoUrl,
+    mediaId,
     onSeek,
     onUpdateCaption,
     onDeleteCaption,
@@ -269,7 +269,7 @@ const Timeline = React.forwardRef(({
                 }}
             >
                 <div style={{ position: 'absolute', top: 0, left: 0, bottom: 0 }}>
-                    <AudioWaveform videoUrl={videoUrl} zoom={zoom} duration={totalDuration} />
+                    <AudioWaveform mediaId={mediaId} zoom={zoom} duration={totalDuration} scrollRef={containerRef} />
                 </div>
 
                 <Playhead zoom={zoom} playheadRef={playheadRef} />